@@ -1,3 +1,6 @@
+import functools
+import math
+import re
 import sys
 
 sys.setrecursionlimit(10_000)
@@ -47,6 +50,10 @@ def number_or_symbol(x):
     '1.2.3.4'
     >>> number_or_symbol('x')
     'x'
+
+    Symbols are interned, so every occurrence of a name is the same object
+    and dictionary lookups on it (special forms, builtins, environments) can
+    succeed on an identity check.
     """
     try:
         return int(x)
@@ -54,7 +61,12 @@ def number_or_symbol(x):
         try:
             return float(x)
         except ValueError:
-            return x
+            return sys.intern(x)
+
+
+# Matches a comment, a left paren (group 1), a right paren (group 2), or any
+# other whitespace-separated value (group 3).  Comments match no group.
+TOKEN_RE = re.compile(r'#[^\n]*|(\()|(\))|([^\s()#]+)')
 
 
 def tokenize(source):
@@ -66,33 +78,26 @@ def tokenize(source):
         source (str): a string containing the source code of a Lisp
                       expression
     """
-    res = []
-    i = 0
-    while i < len(source):
-        if source[i] == "(":
-            res.append("(")
-            i += 1
-        elif source[i] == ")":
-            res.append(")")
-            i += 1
-        elif source[i] == "#":
-            while i < len(source) and source[i] != "\n":
-                i += 1
-        else:
-            start = i
-            end = i
-            while end < len(source) and (source[end] != " " and source[end] != ")" and source[end] != "(" and source[end] != "\n"):
-                if source[end] == "#":
-                    while end < len(source) and source[end] != "\n":
-                        end += 1
-                    break
-                end += 1
-            if i != end:
-                res.append(source[start:end])
-                i = end
-            else:
-                i += 1
-    return res
+    return [match.group() for match in TOKEN_RE.finditer(source)
+            if match.lastindex is not None]
+
+
+def _parse(tokens, token):
+    """
+    Parses the single expression beginning with the given token, pulling any
+    further tokens it needs from the iterator tokens.
+    """
+    if token is None or token == ")":
+        raise LispSyntaxError
+    if token != "(":
+        return number_or_symbol(token)
+
+    parsed = []
+    for token in tokens:
+        if token == ")":
+            return parsed
+        parsed.append(_parse(tokens, token))
+    raise LispSyntaxError
 
 
 def parse(tokens):
@@ -103,38 +108,16 @@ def parse(tokens):
         * S-expressions are represented as Python lists
 
     Arguments:
-        tokens (list): a list of strings representing tokens
+        tokens (iterable): a list (or other iterable) of strings representing
+                           tokens
     """
-    if tokens[0] == ")" or tokens[-1] == "(" or tokens[0] == ":=":
+    tokens = iter(tokens)
+    token = next(tokens, None)
+    if token == ":=":
         raise LispSyntaxError
 
-    if len(tokens) == 1:
-        if tokens[0] in ["(", ")"]:
-            raise LispSyntaxError
-        else:
-            return number_or_symbol(tokens[0])
-
-    elif len(tokens) == 3:
-        if tokens[0] == "(" and tokens[2] == ")":
-            return [tokens[1]]    
-    
-    paren_stack = []
-    parsed = []
-    for i in range(1, len(tokens) - 1):
-        if tokens[i] == "(":
-            paren_stack.append(i)
-        elif tokens[i] == ")":
-            if len(paren_stack) == 0:
-                raise LispSyntaxError
-            elif len(paren_stack) == 1:
-                beg_idx = paren_stack.pop()
-                parsed.append(parse(tokens[beg_idx : i+1]))
-            else:
-                paren_stack.pop()
-        elif len(paren_stack) == 0:
-            parsed.append(number_or_symbol(tokens[i]))
-
-    if len(paren_stack) != 0: 
+    parsed = _parse(tokens, token)
+    if next(tokens, None) is not None:
         raise LispSyntaxError
     return parsed
 
@@ -142,46 +125,55 @@ def parse(tokens):
 # Built-in Functions
 
 def multiply(args):
-    res = 1
-    for i in range(len(args)):
-        res *= args[i]
-    return res
+    return math.prod(args)
 
 def divide(args):
     res = args[0]
-    for i in range(1, len(args)):
-        res /= args[i]
+    for arg in args[1:]:
+        res /= arg
     return res
 
 def equal(args):
     base = args[0]
-    for i in range(1, len(args)):
-        if args[i] != base:
+    for arg in args[1:]:
+        if arg != base:
             return False
     return True
 
 def decreasing(args):
-    for i in range(len(args) - 1):
-        if args[i] <= args[i+1]:
+    rest = iter(args)
+    prev = next(rest, None)
+    for arg in rest:
+        if prev <= arg:
             return False
+        prev = arg
     return True
 
 def nonincreasing(args):
-    for i in range(len(args) - 1):
-        if args[i] < args[i+1]:
+    rest = iter(args)
+    prev = next(rest, None)
+    for arg in rest:
+        if prev < arg:
             return False
+        prev = arg
     return True
 
 def increasing(args):
-    for i in range(len(args) - 1):
-        if args[i] >= args[i+1]:
+    rest = iter(args)
+    prev = next(rest, None)
+    for arg in rest:
+        if prev >= arg:
             return False
+        prev = arg
     return True
 
 def nondecreasing(args):
-    for i in range(len(args) - 1):
-        if args[i] > args[i+1]:
+    rest = iter(args)
+    prev = next(rest, None)
+    for arg in rest:
+        if prev > arg:
             return False
+        prev = arg
     return True
 
 def flip(args):
@@ -189,114 +181,112 @@ def flip(args):
         raise LispEvaluationError
     return not args[0]
 
-def head(args):
-    if type(args) != Pair or len(args) != 2:
-        raise LispEvaluationError
-    return args[0]
-
 def pair_assign(args):
     if len(args) != 2:
         raise LispEvaluationError
     return Pair(args[0], args[1])
 
 def head(args):
-    if len(args) != 1 or type(args[0]) != Pair:
+    if len(args) != 1 or type(args[0]) is not Pair:
         raise LispEvaluationError
     return args[0].head
 
 def tail(args):
-    if len(args) != 1 or type(args[0]) != Pair:
+    if len(args) != 1 or type(args[0]) is not Pair:
         raise LispEvaluationError
     return args[0].tail
 
 def create_list(args):
-    if len(args) == 0:
-        return None
-    return Pair(args[0], create_list(args[1:]))
+    res = None
+    for item in reversed(args):
+        res = Pair(item, res)
+    return res
 
 def is_linked_list(args):
-    if args == None:
-        return True
-    if type(args) == Pair:
-        return is_linked_list(args.tail) 
-    return False
+    while type(args) is Pair:
+        args = args.tail
+    return args is None
 
 def length(args):
-    if args != None and type(args) != Pair:
-        raise LispEvaluationError
-    elif args == None:
-        return 0
-    return 1 + length(args.tail)
+    res = 0
+    while args is not None:
+        if type(args) is not Pair:
+            raise LispEvaluationError
+        res += 1
+        args = args.tail
+    return res
 
 def retrieve_n(linked_list, idx):
-    if not type(linked_list) == Pair and idx >= length(linked_list):
+    if type(linked_list) is not Pair or idx < 0:
         raise LispEvaluationError
     if idx == 0:
         return linked_list.head
-    if type(linked_list) == Pair and is_linked_list(linked_list) == False:
-        raise LispEvaluationError
-    
-    return retrieve_n(linked_list.tail, idx-1)
-
-def merge(first, second):
-    if first == None:
-        return second
-    else:
-        return Pair(first.head, merge(first.tail, second))
-
-def duplicate(args):
-    if args == None:
-        return None
-    if type(args) != Pair:
+    if is_linked_list(linked_list) == False:
         raise LispEvaluationError
-    return Pair(args.head, duplicate(args.tail))
+
+    while idx > 0:
+        linked_list = linked_list.tail
+        if type(linked_list) is not Pair:
+            raise LispEvaluationError
+        idx -= 1
+    return linked_list.head
 
 def concat(args):
-    if args == None:
-        return None
-    if len(args) == 1:
-        return args[0]
-    if len(args) == 0:
-        return None
-    joined_list = merge(duplicate(args[0]), duplicate(args[1]))
-    try:
-        return concat([joined_list] + args[2:])
-    except:
-        return joined_list
+    items = []
+    for lis in args:
+        while lis is not None:
+            if type(lis) is not Pair:
+                raise LispEvaluationError
+            items.append(lis.head)
+            lis = lis.tail
+    return create_list(items)
 
 def map(function, lis):
-    res = None
-    for i in range(length(lis)):
-        res = Pair(evaluate([function, retrieve_n(lis, length(lis) - i - 1)]), res)
-    return res
+    items = []
+    while lis is not None:
+        if type(lis) is not Pair:
+            raise LispEvaluationError
+        items.append(evaluate([function, lis.head]))
+        lis = lis.tail
+    return create_list(items)
 
 def filter(function, lis):
-    if type(function) != Function and function not in Lisp_builtins:
+    if type(function) is not Function and function not in Lisp_builtins:
         raise LispEvaluationError
 
-    if type(lis) != Pair and lis != None:
-        raise LispEvaluationError
-    
-    if lis == None:
-        return None
-
-    if func_eval(function, [lis.head]) == True:
-        return Pair(lis.head, filter(function, lis.tail))
-    return filter(function, lis.tail)
+    items = []
+    while lis is not None:
+        if type(lis) is not Pair:
+            raise LispEvaluationError
+        if func_eval(function, [lis.head]) == True:
+            items.append(lis.head)
+        lis = lis.tail
+    return create_list(items)
 
 def reduce(function, lis, base):
     temp = base
-    for i in range(length(lis)):
-        temp = evaluate([function, temp, retrieve_n(lis, i)])
+    while lis is not None:
+        if type(lis) is not Pair:
+            raise LispEvaluationError
+        temp = evaluate([function, temp, lis.head])
+        lis = lis.tail
     return temp
 
 def begin(args):
     return args[-1]
 
+@functools.lru_cache(maxsize=128)
+def _factorial(n):
+    res = 1
+    while n > 1:
+        res *= n
+        n -= 1
+    return res
+
 def factorial(args):
-    if args == 1:
-        return 1
-    return args * factorial(args - 1)
+    if len(args) != 1 or type(args[0]) is not int or args[0] < 0:
+        raise LispEvaluationError
+    return _factorial(args[0])
 
 Lisp_builtins = {
     "+": sum,
@@ -330,21 +320,26 @@ Lisp_builtins = {
 # Evaluation 
 
 class Environment:
+    __slots__ = ('var_bind', 'parent')
+
     def __init__(self, parent = None):
         self.var_bind = {}
         self.parent = parent
     
     def retrieve(self, var):
-        if var in self.var_bind:
-            return self.var_bind[var]
-        elif type(self.parent) == dict and var in self.parent:
-            return self.parent[var]
-        elif var in Lisp_builtins:
-            return Lisp_builtins[var]
-        elif type(self.parent) == Environment:
-            return self.parent.retrieve(var)
-        else:
-            raise LispNameError
+        env = self
+        while True:
+            if var in env.var_bind:
+                return env.var_bind[var]
+            parent = env.parent
+            if type(parent) is dict and var in parent:
+                return parent[var]
+            elif var in Lisp_builtins:
+                return Lisp_builtins[var]
+            elif type(parent) is not Environment:
+                raise LispNameError
+            env = parent
+
     def delete(self, name):
         if name in self.var_bind:
             temp = self.var_bind[name]
@@ -352,108 +347,169 @@ class Environment:
             return temp
         raise LispNameError
 
+# Shared environment used by evaluate and evaluate_file when no environment
+# is given.
+GLOBAL_ENV = Environment()
+
 class Function:
+    __slots__ = ('body', 'params', 'env')
+
     def __init__(self, body, params, env):
         self.body = body 
         self.params = params
         self.env = env
 
 class Pair:
+    __slots__ = ('head', 'tail')
+
     def __init__(self, head, tail):
         self.head = head
         self.tail = tail
 
-def evaluate_file(file, env = Environment()):
+def evaluate_file(file, env = None):
+    if env is None:
+        env = GLOBAL_ENV
     with open(file, 'r') as f:
         file_txt = f.read()
-        tokenized = tokenize(file_txt)
-        parsed = parse(tokenized)
+        parsed = parse(tokenize(file_txt))
         return evaluate(parsed, env)
 
-def func_eval(function_obj, function_args):    
+def bind_args(function_obj, function_args):
+    """
+    Creates the environment for a call to function_obj, binding each of its
+    parameters to the corresponding value in function_args.  Raises a
+    LispEvaluationError if the number of arguments does not match.
+    """
+    if len(function_args) != len(function_obj.params):
+        raise LispEvaluationError
     func_env = Environment(function_obj.env)
-    for i in range(len(function_args)):
-        func_env.var_bind[function_obj.params[i]] = function_args[i]
-    return evaluate(function_obj.body, func_env)
+    for param, arg in zip(function_obj.params, function_args):
+        func_env.var_bind[param] = arg
+    return func_env
+
+def func_eval(function_obj, function_args):
+    return evaluate(function_obj.body, bind_args(function_obj, function_args))
+
+
+
+# Special Forms
+#
+# Each handler takes the full expression and the environment it is evaluated
+# in.  SPECIAL_FORMS maps each keyword to a (handler, is_tail) pair.  Other
+# handlers return the value of the expression; tail handlers return the
+# (tree, env) pair that evaluate should continue with, so the expression in
+# tail position is evaluated without recursing.
+
+def _eval_function(tree, env):
+    return Function(tree[2], tree[1], env)
+
+def _eval_define(tree, env):
+    if type(tree[1]) is list:
+        env.var_bind[tree[1][0]] = Function(tree[2], tree[1][1:], env)
+        return env.var_bind[tree[1][0]]
+    env.var_bind[tree[1]] = evaluate(tree[2], env)
+    return env.var_bind[tree[1]]
 
+def _eval_and(tree, env):
+    for arg in tree[1:]:
+        if evaluate(arg, env) == False:
+            return False
+    return True
+
+def _eval_or(tree, env):
+    for arg in tree[1:]:
+        if evaluate(arg, env) == True:
+            return True
+    return False
+
+def _eval_del(tree, env):
+    return env.delete(tree[1])
+
+def _eval_set(tree, env):
+    current_env = env
+    while True:
+        if tree[1] in current_env.var_bind:
+            current_env.var_bind[tree[1]] = evaluate(tree[2], env)
+            return current_env.var_bind[tree[1]]
+        if current_env.parent is None:
+            raise LispNameError
+        current_env = current_env.parent
+
+def _eval_if(tree, env):
+    if evaluate(tree[1], env) == True:
+        return tree[2], env
+    return tree[3], env
+
+def _eval_let(tree, env):
+    func_env = Environment(env)
+    for i in tree[1]:
+        func_env.var_bind[i[0]] = evaluate(i[1], env)
+    return tree[2], func_env
+
+SPECIAL_FORMS = {
+    "function": (_eval_function, False),
+    ":=": (_eval_define, False),
+    "and": (_eval_and, False),
+    "or": (_eval_or, False),
+    "del": (_eval_del, False),
+    "set!": (_eval_set, False),
+    "if": (_eval_if, True),
+    "let": (_eval_let, True),
+}
+
+# Intern the keyword names so they are the same objects as the symbols
+# produced by number_or_symbol.
+for _table in (Lisp_builtins, SPECIAL_FORMS):
+    for _name in list(_table):
+        _table[sys.intern(_name)] = _table.pop(_name)
+del _table, _name
 
 
-def evaluate(tree, env = Environment()):
+def evaluate(tree, env = None):
     """
     Evaluate the given syntax tree according to the rules of the Lisp
     language.
 
+    Expressions in tail position (the chosen branch of an if, the body of a
+    let, and the body of a called function) are evaluated by looping rather
+    than recursing, so tail calls do not grow the Python stack.
+
     Arguments:
         tree (type varies): a fully parsed expression, as the output from the
                             parse function
+        env (Environment): the environment to evaluate in; defaults to
+                           GLOBAL_ENV
     """
-    if type(tree) in [int, float, Function, Pair]:
-        return tree
-    
-    elif type(tree) == list:
-        if tree == [] or type(tree[0]) == int:
-            raise LispEvaluationError
- 
-        if tree[0] == "function":
-            return Function(tree[2], tree[1], env)
-        
-        elif tree[0] == ":=":
-            if type(tree[1]) == list:
-                env.var_bind[tree[1][0]] = Function(tree[2], tree[1][1:], env)
-                return env.var_bind[tree[1][0]]
-            env.var_bind[tree[1]] = evaluate(tree[2], env)
-            return env.var_bind[tree[1]]
-        
-        elif tree[0] == "if":
-            if evaluate(tree[1], env) == True:
-                return evaluate(tree[2], env)
-            return evaluate(tree[3], env)
-        
-        elif tree[0] == "and":
-            for i in range(1, len(tree)):
-                if evaluate(tree[i], env) == False:
-                    return False
-            return True
+    if env is None:
+        env = GLOBAL_ENV
+    while True:
+        if type(tree) in (int, float, Function, Pair):
+            return tree
+
+        elif type(tree) is list:
+            if tree == [] or type(tree[0]) is int:
+                raise LispEvaluationError
 
-        elif tree[0] == "or":
-            for i in range(1, len(tree)):
-                if evaluate(tree[i], env) == True:
-                    return True
-            return False
-        elif tree[0] == "del":
-            return env.delete(tree[1])
-
-        elif tree[0] == 'let':
-            func_env = Environment(env)
-            for i in tree[1]:
-                func_env.var_bind[i[0]] = evaluate(i[1], env)
-            return evaluate(tree[2], func_env)
-
-        elif tree[0] == 'set!':
-            current_env = env
-            while True:
-                if tree[1] in current_env.var_bind:
-                    current_env.var_bind[tree[1]] = evaluate(tree[2], env)
-                    return current_env.var_bind[tree[1]]
-                if current_env.parent == None:
-                    raise LispNameError
-                current_env = current_env.parent
+            if type(tree[0]) is str:
+                form = SPECIAL_FORMS.get(tree[0])
+                if form is not None:
+                    handler, is_tail = form
+                    if not is_tail:
+                        return handler(tree, env)
+                    tree, env = handler(tree, env)
+                    continue
 
-        else:
             func_obj = evaluate(tree[0], env)
-            function_args = []
-            for i in range(1, len(tree)):
-                    function_args.append(evaluate(tree[i], env))
-            if type(func_obj) == Function:
-                if len(function_args) == len(func_obj.params):
-                    return func_eval(func_obj, function_args)
-                raise LispEvaluationError
+            function_args = [evaluate(arg, env) for arg in tree[1:]]
+            if type(func_obj) is Function:
+                tree, env = func_obj.body, bind_args(func_obj, function_args)
+                continue
             return func_obj(function_args)
-    elif callable(tree) == True or tree == None:
-        return tree
-    else:
-        return env.retrieve(tree)
-        
+        elif callable(tree) == True or tree is None:
+            return tree
+        else:
+            return env.retrieve(tree)
+
 
 
 def REPL():
@@ -468,7 +524,7 @@ def REPL():
 
 
 def result_and_env(tree, env = None):
-    if env == None: 
+    if env is None: 
         env = Environment()
     result = evaluate(tree, env)
     return result, env
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import pytest
+
+import lisp_interpreter as lisp
+
+
+def run(source, env):
+    return lisp.evaluate(lisp.parse(lisp.tokenize(source)), env)
+
+
+def test_tail_recursion():
+    env = lisp.Environment()
+    run("(:= (f n acc) (if (<= n 0) acc (f (- n 1) (+ acc n))))", env)
+    assert run("(f 50000 0)", env) == 50000 * 50001 // 2
+
+
+def test_factorial():
+    env = lisp.Environment()
+    assert run("(factorial 0)", env) == 1
+    assert run("(factorial 5)", env) == 120
+    assert run("(factorial 20)", env) == 2432902008176640000
+    for source in ["(factorial)", "(factorial 3 4)", "(factorial 3.5)",
+                   "(factorial -4)", "(factorial (list 1))"]:
+        with pytest.raises(lisp.LispEvaluationError):
+            run(source, env)
+
+
+def parse_str(source):
+    return lisp.parse(lisp.tokenize(source))
+
+
+def test_parse_outputs():
+    assert parse_str("x") == 'x'
+    assert parse_str("6.28") == 6.28
+    assert parse_str("()") == []
+    assert parse_str("((a))") == [['a']]
+    assert parse_str("(numbers 3.14 3 -2 -2.4)") == ['numbers', 3.14, 3, -2, -2.4]
+    assert parse_str("(:= (square x) (* x x))") == [':=', ['square', 'x'], ['*', 'x', 'x']]
+
+
+def test_parse_errors():
+    for source in ["", ":=", "1 2", "(a) (b)", "(a))", "((a)", "(", ")", ")(a)("]:
+        with pytest.raises(lisp.LispSyntaxError):
+            parse_str(source)
+
+
+def test_tokenize_whitespace_and_comments():
+    assert lisp.tokenize("(a\tb\r\nc)") == ['(', 'a', 'b', 'c', ')']
+    assert lisp.tokenize("(1#comment (\n2)") == ['(', '1', '2', ')']
+    assert lisp.tokenize("1#comment") == ['1']
+
+
+LONG = 30000
+
+
+def long_list_env():
+    env = lisp.Environment()
+    env.var_bind['l'] = lisp.create_list(list(range(LONG)))
+    return env
+
+
+def test_long_list_helpers():
+    env = long_list_env()
+    assert run("(list? l)", env) == True
+    assert run("(length l)", env) == LONG
+    assert run("(nth l %d)" % (LONG - 1), env) == LONG - 1
+
+
+def test_long_list_map_filter_reduce():
+    env = long_list_env()
+    assert run("(length (map (function (x) (* 2 x)) l))", env) == LONG
+    assert run("(nth (map (function (x) (* 2 x)) l) %d)" % (LONG - 1), env) == 2 * (LONG - 1)
+    assert run("(length (filter (function (x) (=? x x)) l))", env) == LONG
+    assert run("(reduce (function (a x) (+ a x)) l 0)", env) == LONG * (LONG - 1) // 2
+
+
+def test_concat_rejects_non_lists():
+    env = lisp.Environment()
+    for source in ["(concat 7 8 9)", "(concat 7)", "(concat (list 1) 2)",
+                   "(concat (list 1) (pair 2 3))"]:
+        with pytest.raises(lisp.LispEvaluationError):
+            run(source, env)
+
+
+def test_long_list_concat():
+    env = long_list_env()
+    assert run("(length (concat l l))", env) == 2 * LONG
+    assert run("(nth (concat l (list -1)) %d)" % LONG, env) == -1